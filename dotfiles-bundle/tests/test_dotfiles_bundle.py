@@ -4,11 +4,20 @@ Tests for dotfiles-bundle
 Run with: uv run pytest tests/test_dotfiles_bundle.py -v
 """
 
+import gzip
+import hashlib
+import io
 import json
+import os
+import re
+import shutil
+import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
 import types
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -52,6 +61,7 @@ _place_new_file = dotfiles_bundle._place_new_file
 _place_new_remote_files = dotfiles_bundle._place_new_remote_files
 _prompt_new_file_placement = dotfiles_bundle._prompt_new_file_placement
 glob_match = dotfiles_bundle.glob_match
+PatternSet = dotfiles_bundle.PatternSet
 deep_merge = dotfiles_bundle.deep_merge
 format_size = dotfiles_bundle.format_size
 BundleConfig = dotfiles_bundle.BundleConfig
@@ -59,6 +69,9 @@ BundleResolver = dotfiles_bundle.BundleResolver
 FileResolver = dotfiles_bundle.FileResolver
 OverrideManager = dotfiles_bundle.OverrideManager
 PackageBuilder = dotfiles_bundle.PackageBuilder
+CompositionCache = dotfiles_bundle.CompositionCache
+ResolutionIndex = dotfiles_bundle.ResolutionIndex
+HashCache = dotfiles_bundle.HashCache
 ResolvedFile = dotfiles_bundle.ResolvedFile
 FileProvenance = dotfiles_bundle.FileProvenance
 
@@ -244,6 +257,131 @@ class TestGlobMatch:
             assert not glob_match(pattern, path), f"{path} should not match {pattern}"
 
 
+class TestPatternSet:
+    """Tests for the compiled PatternSet matcher."""
+
+    PATTERNS = [
+        ".zshrc",
+        "*.txt",
+        ".bin/*",
+        ".config/",
+        "**/.git/",
+        "**/__pycache__/",
+        ".claude/settings.json.*",
+        ".env.d/common/",
+        "a/**/b",
+        "*cache*/*.tmp",
+        "[!.]*.md",
+        "notes?.log",
+    ]
+    PATHS = [
+        ".zshrc",
+        ".bashrc",
+        "file.txt",
+        "docs/file.txt",
+        ".bin/script.sh",
+        ".bin/sub/script.sh",
+        ".config",
+        ".config/nvim/init.lua",
+        ".configx/file",
+        ".git",
+        "foo/bar/.git/HEAD",
+        "foo/.gitignore",
+        "pkg/__pycache__/mod.pyc",
+        ".claude/settings.json.bak",
+        ".claude/settings.json",
+        ".env.d/commonfile",
+        "a/b",
+        "a/x/y/b",
+        "b/a/b",
+        "my-cache-dir/x.tmp",
+        "cache.tmp",
+        "README.md",
+        ".hidden.md",
+        "notes1.log",
+        "notes12.log",
+    ]
+
+    @pytest.mark.parametrize("path", PATHS)
+    def test_pattern_set_should_agree_with_glob_match(self, path: str):
+        # GIVEN
+        pattern_set = PatternSet(self.PATTERNS)
+
+        # WHEN
+        result = pattern_set.matches(path)
+
+        # THEN
+        assert result == any(glob_match(p, path) for p in self.PATTERNS)
+
+    def test_pattern_set_should_be_falsy_when_empty(self):
+        # GIVEN
+        pattern_set = PatternSet([])
+
+        # WHEN/THEN
+        assert not pattern_set
+        assert not pattern_set.matches(".zshrc")
+
+    def test_pattern_set_should_filter_out_matching_paths(self):
+        # GIVEN
+        pattern_set = PatternSet([".config/nvim/lazy-lock.json", "**/README.md"])
+
+        # WHEN
+        result = pattern_set.filter_out([
+            ".config/nvim/lazy-lock.json",
+            ".tmux/plugins/tpm/README.md",
+            ".zshrc",
+        ])
+
+        # THEN
+        assert result == [".zshrc"]
+
+    @pytest.mark.parametrize(
+        "dir_path,expected",
+        [
+            (".tmux/plugins/tpm/.git", True),
+            (".tmux/plugins", False),
+            (".cache", True),
+            (".cache/zsh", True),
+            (".config", False),
+        ],
+    )
+    def test_pattern_set_should_report_covered_directories(self, dir_path: str, expected: bool):
+        # GIVEN - only directory patterns cover a whole subtree
+        pattern_set = PatternSet(["**/.git/", ".cache/", "*.log"])
+
+        # WHEN/THEN
+        assert pattern_set.covers(dir_path) is expected
+
+    @pytest.mark.parametrize("path", PATHS)
+    def test_pattern_set_regex_should_agree_with_matches_and_covers(self, path: str):
+        # GIVEN
+        pattern_set = PatternSet(self.PATTERNS)
+
+        # WHEN
+        matches = re.match(pattern_set.regex(), path) is not None
+        covers = re.match(pattern_set.regex(subtree=True), path) is not None
+
+        # THEN
+        assert matches == pattern_set.matches(path)
+        assert covers == pattern_set.covers(path)
+
+    @pytest.mark.parametrize(
+        "pattern", ["*foo*bar*", "**x", "a?b*", "[!a-c]*z", "[]x]*", "[^x]", "[a&&b]", "[unclosed*", "x.*.y"]
+    )
+    def test_fnmatch_regex_should_match_like_fnmatch_without_atomic_groups(self, pattern: str):
+        # GIVEN
+        candidates = ["foobar", "xfooybarz", "barfoo", "x", "aab", "azbq", "dz", "az", "]x", "xx", "^", "&", "[unclosedq", "x.1.y", "a/b"]
+
+        # WHEN
+        regex = dotfiles_bundle._fnmatch_regex(pattern)
+
+        # THEN - same matches as fnmatch.translate, with syntax older Pythons compile
+        assert "(?>" not in regex
+        for candidate in candidates:
+            expected = re.match(dotfiles_bundle.fnmatch_translate(pattern), candidate) is not None
+            assert (re.match(regex, candidate) is not None) == expected, candidate
+
+
 # ============================================================================
 # Pure Function Tests: deep_merge
 # ============================================================================
@@ -338,6 +476,57 @@ class TestFormatSize:
         assert result == expected
 
 
+# ============================================================================
+# Pure Function Tests: file records
+# ============================================================================
+
+
+class TestFileRecords:
+    """Tests for the compact ResolvedFile / FileProvenance records."""
+
+    def test_resolved_file_should_decode_source_fields(self):
+        # GIVEN
+        resolved = ResolvedFile(
+            source_path=Path("/repo/links/.zshrc"), relative_path=".zshrc", source_type="links-in-depth"
+        )
+
+        # WHEN/THEN
+        assert resolved.source_path == Path("/repo/links/.zshrc")
+        assert resolved.source == "/repo/links/.zshrc"
+        assert resolved.source_type == "links-in-depth"
+        assert not hasattr(resolved, "__dict__")
+
+    def test_resolved_file_should_compare_like_a_dataclass(self):
+        # GIVEN
+        a = ResolvedFile(source_path="/src/a", relative_path=".a", source_type="runtime")
+        b = ResolvedFile(source_path=Path("/src/a"), relative_path=".a", source_type="runtime")
+
+        # WHEN/THEN
+        assert a == b
+        assert a != ResolvedFile(source_path="/src/a", relative_path=".a", source_type="links")
+        assert repr(a) == (
+            "ResolvedFile(source_path=PosixPath('/src/a'), relative_path='.a', source_type='runtime', digest=None)"
+        )
+
+    def test_file_records_should_share_interned_relative_paths(self):
+        # GIVEN
+        rel = "".join([".config/", "nvim/init.lua"])  # Built at runtime, not a constant
+
+        # WHEN
+        resolved = ResolvedFile(source_path="/src/init.lua", relative_path=rel, source_type="links")
+        provenance = FileProvenance(
+            deployed_path=".config/nvim/" + "init.lua",
+            source_type=resolved.source_type,
+            source_path=resolved.source,
+            has_overrides=False,
+            override_mode=None,
+        )
+
+        # THEN
+        assert provenance.deployed_path is resolved.relative_path
+        assert provenance.source is resolved.source
+
+
 # ============================================================================
 # Integration Tests: BundleResolver
 # ============================================================================
@@ -438,6 +627,27 @@ install = ["tmux"]
         names = [b.name for b in bundles]
         assert sorted(names) == ["bundle1", "bundle2", "bundle3"]
 
+    @pytest.mark.parametrize(
+        "child_archive, expected",
+        [
+            ("", ("xz", 9)),
+            ("[archive]\nlevel = 3", ("xz", 3)),
+            ('[archive]\ncodec = "gz"', ("gz", None)),
+        ],
+    )
+    def test_bundle_resolver_should_inherit_archive_settings(
+        self, mock_repo: MockDotfilesRepo, child_archive: str, expected: tuple
+    ):
+        # GIVEN
+        mock_repo.create_bundle("base", '[bundle]\nname = "base"\n\n[archive]\ncodec = "xz"\nlevel = 9')
+        mock_repo.create_bundle("nas", f'[bundle]\nname = "nas"\nextends = "base"\n\n{child_archive}')
+
+        # WHEN
+        config = BundleResolver(mock_repo.bundles_dir).resolve("nas")
+
+        # THEN
+        assert (config.archive_codec, config.archive_level) == expected
+
 
 # ============================================================================
 # Integration Tests: FileResolver
@@ -593,6 +803,348 @@ class TestFileResolver:
         assert ".config/nvim/init.lua" in paths
         assert ".config/starship.toml" in paths
 
+    def test_file_resolver_should_prefer_links_over_links_in_depth(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        mock_repo.create_file(".bin/tool.sh", "# from links")
+        mock_repo.create_in_depth_file(".bin/tool.sh", "# from in-depth")
+        mock_repo.create_in_depth_file(".bin/extra.sh", "# only in-depth")
+        config = BundleConfig(
+            name="test",
+            files_include=[".bin/", ".bin/*.sh"],
+        )
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+
+        # WHEN
+        files = resolver.resolve_bundle(config)
+
+        # THEN
+        by_path = {f.relative_path: f.source_type for f in files}
+        assert by_path == {".bin/tool.sh": "links", ".bin/extra.sh": "links-in-depth"}
+
+    def test_file_resolver_should_resolve_recursive_glob_pattern(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        mock_repo.create_file(".config/app.conf", "# top")
+        mock_repo.create_file(".config/a/b/deep.conf", "# deep")
+        mock_repo.create_file(".config/a/b/deep.txt", "# not conf")
+        mock_repo.create_file(".config/theme/file.txt", "# theme")
+        config = BundleConfig(
+            name="test",
+            files_include=[".config/**/*.conf", ".config/**"],
+        )
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+
+        # WHEN
+        files = resolver.resolve_bundle(config)
+
+        # THEN - a trailing ** matches directories, which include their files
+        paths = [f.relative_path for f in files]
+        assert paths == [
+            ".config/a/b/deep.conf",
+            ".config/a/b/deep.txt",
+            ".config/app.conf",
+            ".config/theme/file.txt",
+        ]
+
+    def test_file_resolver_should_not_descend_into_unmatched_directories(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".config/nvim/init.lua", "# nvim")
+        mock_repo.create_file(".local/share/big/data.bin", "# data")
+        config = BundleConfig(
+            name="test",
+            files_include=[".zshrc", ".config/nvim/"],
+        )
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+        scanned = []
+        real_scandir = os.scandir
+
+        def recording_scandir(path):
+            scanned.append(Path(path))
+            return real_scandir(path)
+
+        monkeypatch.setattr(dotfiles_bundle.os, "scandir", recording_scandir)
+
+        # WHEN
+        files = resolver.resolve_bundle(config)
+
+        # THEN
+        assert [f.relative_path for f in files] == [".config/nvim/init.lua", ".zshrc"]
+        assert mock_repo.links_dir / ".local" not in scanned
+        assert mock_repo.links_dir / ".local/share" not in scanned
+
+    def test_file_resolver_should_prune_excluded_runtime_directories(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/tpm", "# tpm")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/.git/HEAD", "ref")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/.git/objects/ab/cdef", "blob")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/tests/test_tpm", "# test")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/README.md", "# readme")
+        config = BundleConfig(
+            name="test",
+            files_include=[".zshrc"],
+            runtime_include=[".tmux/plugins/"],
+            runtime_exclude=["**/.git/", "**/tests/", "**/README.md"],
+        )
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+
+        # WHEN
+        files = resolver.resolve_bundle(config)
+
+        # THEN
+        runtime = [f.relative_path for f in files if f.source_type == "runtime"]
+        assert runtime == [".tmux/plugins/tpm/tpm"]
+        stats = resolver.runtime_stats
+        assert stats.kept == 1
+        assert stats.pruned == 2
+        assert stats.visited == 5  # tpm/, and tpm/'s four entries; .git and tests not listed
+
+
+# ============================================================================
+# Integration Tests: ResolutionIndex
+# ============================================================================
+
+
+def _age_directories(*roots: Path, seconds: int = 60) -> None:
+    """Move directory mtimes into the past so the index trusts their listings."""
+    for root in roots:
+        for dir_path in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+            past = dir_path.stat().st_mtime - seconds
+            os.utime(dir_path, (past, past))
+
+
+class TestResolutionIndex:
+    """Tests for the persisted file-resolution index."""
+
+    BUNDLE_TOML = """
+[bundle]
+name = "indexed"
+
+[files]
+include = [".zshrc", ".config/"]
+"""
+
+    def _resolve(self, mock_repo: MockDotfilesRepo) -> tuple[list[str], ResolutionIndex]:
+        config = BundleResolver(bundles_dir=mock_repo.bundles_dir).resolve("indexed")
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+        files = resolver.resolve_bundle(config)
+        return [f.relative_path for f in files], resolver.index
+
+    def test_resolution_index_should_serve_warm_runs_without_listing(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        mock_repo.create_bundle("indexed", self.BUNDLE_TOML)
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".config/nvim/init.lua", "# nvim")
+        _age_directories(mock_repo.links_dir, mock_repo.links_in_depth_dir)
+        cold_paths, cold_index = self._resolve(mock_repo)
+
+        def fail_scan(path):
+            raise AssertionError(f"unexpected listing of {path}")
+
+        monkeypatch.setattr(dotfiles_bundle, "scan_dir", fail_scan)
+
+        # WHEN
+        warm_paths, warm_index = self._resolve(mock_repo)
+
+        # THEN
+        assert cold_index.misses > 0
+        assert warm_paths == cold_paths == [".config/nvim/init.lua", ".zshrc"]
+        assert warm_index.misses == 0
+        assert (mock_repo.bundles_dir / "indexed" / ".cache" / "resolve" / "index.json").exists()
+
+    def test_resolution_index_should_rescan_only_changed_directories(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        mock_repo.create_bundle("indexed", self.BUNDLE_TOML)
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".config/nvim/init.lua", "# nvim")
+        mock_repo.create_file(".config/git/config", "# git")
+        _age_directories(mock_repo.links_dir, mock_repo.links_in_depth_dir)
+        self._resolve(mock_repo)
+
+        # WHEN
+        mock_repo.create_file(".config/nvim/lua/plugins.lua", "# plugins")
+        paths, index = self._resolve(mock_repo)
+
+        # THEN - nvim/ changed and lua/ is new; everything else comes from the index
+        assert ".config/nvim/lua/plugins.lua" in paths
+        assert index.misses == 2
+
+    def test_resolution_index_should_invalidate_on_inherited_bundle_change(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        mock_repo.create_bundle("parent", '[bundle]\nname = "parent"\n\n[files]\ninclude = [".zshrc"]\n')
+        mock_repo.create_bundle("indexed", '[bundle]\nname = "indexed"\nextends = "parent"\n')
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".vimrc", "# vimrc")
+        _age_directories(mock_repo.links_dir, mock_repo.links_in_depth_dir)
+        first_paths, _ = self._resolve(mock_repo)
+
+        # WHEN
+        mock_repo.create_bundle(
+            "parent", '[bundle]\nname = "parent"\n\n[files]\ninclude = [".zshrc", ".vimrc"]\n'
+        )
+        second_paths, index = self._resolve(mock_repo)
+
+        # THEN
+        assert first_paths == [".zshrc"]
+        assert second_paths == [".vimrc", ".zshrc"]
+        assert index.hits == 0
+
+
+# ============================================================================
+# Integration Tests: RuntimeSnapshots
+# ============================================================================
+
+
+def _git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True, capture_output=True,
+    )
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+class TestRuntimeSnapshots:
+    """Tests for git-commit-aware snapshots of runtime checkouts."""
+
+    BUNDLE_TOML = """
+[bundle]
+name = "plugins"
+
+[runtime]
+include = [".tmux/plugins/"]
+exclude = ["**/.git/"]
+"""
+
+    @pytest.fixture(autouse=True)
+    def _without_resolution_index(self, monkeypatch):
+        # Exercise the walk itself rather than the index fast path
+        monkeypatch.setattr(FileResolver, "resolution_index", lambda self, config: None)
+
+    def _make_plugin(self, mock_repo: MockDotfilesRepo) -> Path:
+        mock_repo.create_bundle("plugins", self.BUNDLE_TOML)
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/tpm", "#!/bin/sh")
+        mock_repo.create_runtime_file(".tmux/plugins/tpm/scripts/install.sh", "#!/bin/sh")
+        plugin = mock_repo.home_dir / ".tmux/plugins/tpm"
+        _git(plugin, "init", "-q")
+        _git(plugin, "add", "-A")
+        _git(plugin, "commit", "-q", "-m", "init")
+        return plugin
+
+    def _resolve(self, mock_repo: MockDotfilesRepo) -> tuple[dict[str, ResolvedFile], FileResolver]:
+        config = BundleResolver(bundles_dir=mock_repo.bundles_dir).resolve("plugins")
+        resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        )
+        files = resolver.resolve_bundle(config)
+        return {f.relative_path: f for f in files}, resolver
+
+    def test_runtime_snapshots_should_reuse_clean_checkout(self, mock_repo: MockDotfilesRepo, monkeypatch):
+        # GIVEN
+        plugin = self._make_plugin(mock_repo)
+        self._resolve(mock_repo)
+        scanned = []
+        real_scan_dir = dotfiles_bundle.scan_dir
+
+        def recording_scan_dir(path):
+            scanned.append(path)
+            return real_scan_dir(path)
+
+        monkeypatch.setattr(dotfiles_bundle, "scan_dir", recording_scan_dir)
+
+        # WHEN
+        files, resolver = self._resolve(mock_repo)
+
+        # THEN
+        assert sorted(files) == [".tmux/plugins/tpm/scripts/install.sh", ".tmux/plugins/tpm/tpm"]
+        assert resolver.runtime_stats.reused == 1
+        assert str(plugin / "scripts") not in scanned
+        assert files[".tmux/plugins/tpm/tpm"].digest == dotfiles_bundle.file_sha256(plugin / "tpm")
+
+    def test_runtime_snapshots_should_rewalk_dirty_checkout(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        plugin = self._make_plugin(mock_repo)
+        self._resolve(mock_repo)
+
+        # WHEN
+        (plugin / "scripts" / "update.sh").write_text("#!/bin/sh")
+        files, resolver = self._resolve(mock_repo)
+
+        # THEN
+        assert ".tmux/plugins/tpm/scripts/update.sh" in files
+        assert files[".tmux/plugins/tpm/tpm"].digest is None
+        assert resolver.runtime_stats.reused == 0
+
+    def test_runtime_snapshots_should_rewalk_when_commit_moves(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        plugin = self._make_plugin(mock_repo)
+        self._resolve(mock_repo)
+
+        # WHEN
+        (plugin / "scripts" / "update.sh").write_text("#!/bin/sh")
+        _git(plugin, "add", "-A")
+        _git(plugin, "commit", "-q", "-m", "update")
+        files, resolver = self._resolve(mock_repo)
+
+        # THEN
+        assert ".tmux/plugins/tpm/scripts/update.sh" in files
+        assert resolver.runtime_stats.reused == 0
+
+    @pytest.mark.parametrize("ignored", ["init.zsh.zwc", "cache/state/data.bin"])
+    def test_runtime_snapshots_should_rehash_edited_ignored_file(self, mock_repo: MockDotfilesRepo, ignored: str):
+        # GIVEN - a clean checkout with an ignored file and an ignored directory
+        plugin = self._make_plugin(mock_repo)
+        (plugin / ".gitignore").write_text("*.zwc\ncache/\n")
+        _git(plugin, "add", "-A")
+        _git(plugin, "commit", "-q", "-m", "ignore")
+        for rel in ["init.zsh.zwc", "cache/state/data.bin"]:
+            mock_repo.create_runtime_file(f".tmux/plugins/tpm/{rel}", "compiled v1")
+        files, _ = self._resolve(mock_repo)
+        assert files[f".tmux/plugins/tpm/{ignored}"].digest is not None
+
+        # WHEN - the ignored file is rewritten; git status still reports a clean checkout
+        (plugin / ignored).write_text("compiled v2, longer")
+        files, resolver = self._resolve(mock_repo)
+
+        # THEN
+        assert files[f".tmux/plugins/tpm/{ignored}"].digest == dotfiles_bundle.file_sha256(plugin / ignored)
+        assert resolver.runtime_stats.reused == 0
+
 
 # ============================================================================
 # Integration Tests: OverrideManager
@@ -738,16 +1290,528 @@ class TestOverrideManager:
         assert additions[0].target_path == ".secrets"
         assert additions[0].private is True
 
+    def test_override_manager_should_sort_overrides_by_mode_order_and_visibility(
+        self, mock_repo: MockDotfilesRepo
+    ):
+        # GIVEN
+        bundle_dir = mock_repo.bundles_dir / "server"
+        bundle_dir.mkdir(parents=True)
+        for name in [
+            ".zshrc.append",
+            ".zshrc.prepend.1",
+            ".zshrc.prepend.0.private",
+            ".zshrc.prepend.0",
+            ".zshrc.replace",
+        ]:
+            (bundle_dir / name).write_text(name)
+        manager = OverrideManager(mock_repo.bundles_dir)
 
-# ============================================================================
-# Integration Tests: PackageBuilder
-# ============================================================================
-
+        # WHEN
+        overrides = manager.find_overrides("server", ".zshrc")
 
-class TestPackageBuilder:
-    """Tests for package building."""
+        # THEN
+        assert [(o.mode, o.order, o.private) for o in overrides] == [
+            ("prepend", 0, False),
+            ("prepend", 0, True),
+            ("prepend", 1, False),
+            ("replace", 0, False),
+            ("append", 0, False),
+        ]
 
-    def test_package_builder_should_create_tarball(self, mock_repo: MockDotfilesRepo):
+    def test_override_manager_should_scan_bundle_dir_once_for_many_lookups(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        mock_repo.create_override("server", ".zshrc", "# zshrc", mode="append")
+        mock_repo.create_override("server", ".gitconfig", "# gitconfig")
+        manager = OverrideManager(mock_repo.bundles_dir)
+        calls = []
+        original = manager._scan_bundle
+        monkeypatch.setattr(
+            manager, "_scan_bundle", lambda name: calls.append(name) or original(name)
+        )
+
+        # WHEN
+        zshrc = manager.find_overrides("server", ".zshrc")
+        gitconfig = manager.find_overrides("server", ".gitconfig")
+        missing = manager.find_overrides("server", ".vimrc")
+
+        # THEN
+        assert calls == ["server"]
+        assert [o.mode for o in zshrc] == ["append"]
+        assert [o.mode for o in gitconfig] == ["replace"]
+        assert missing == []
+
+    def test_override_manager_should_flatten_addition_directories(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        add_dir = mock_repo.create_addition("server", ".config/my-tool", content=None)
+        (add_dir / "config.toml").write_text("# config")
+        (add_dir / "themes").mkdir()
+        (add_dir / "themes" / "dark.toml").write_text("# dark")
+        (add_dir / "nested.add").write_text("# claimed by the directory")
+        mock_repo.create_addition("server", ".secrets", "secret", private=True)
+        mock_repo.create_addition("server", ".my-config", "config")
+        manifests = mock_repo.bundles_dir / "server" / ".manifests" / "deploy"
+        manifests.mkdir(parents=True)
+        (manifests / "old.add").write_text("not an addition")
+        manager = OverrideManager(mock_repo.bundles_dir)
+
+        # WHEN
+        entries = manager.find_addition_files("server")
+
+        # THEN
+        assert [e.deployed_path for e in entries] == [
+            ".config/my-tool/config.toml",
+            ".config/my-tool/nested.add",
+            ".config/my-tool/themes/dark.toml",
+            ".secrets",
+            ".my-config",
+        ]
+        assert len(manager.find_additions("server")) == 3
+
+
+# ============================================================================
+# Integration Tests: CompositionCache
+# ============================================================================
+
+
+class TestCompositionCache:
+    """Tests for the on-disk cache of composed override outputs."""
+
+    def test_compose_should_reuse_cached_output_when_components_unchanged(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        base = mock_repo.create_file("config.json", json.dumps({"a": 1}))
+        mock_repo.create_override("server", "config.json", json.dumps({"b": 2}), mode="merge")
+        manager = OverrideManager(mock_repo.bundles_dir)
+        overrides = manager.find_overrides("server", "config.json")
+        first = manager.compose("server", base, overrides, "config.json")
+
+        # WHEN — a fresh manager must not re-merge
+        manager = OverrideManager(mock_repo.bundles_dir)
+        monkeypatch.setattr(manager, "_smart_merge", lambda *a: pytest.fail("should hit cache"))
+        second = manager.compose("server", base, overrides, "config.json")
+
+        # THEN
+        assert json.loads(first) == {"a": 1, "b": 2}
+        assert second == first
+        assert manager.composition_cache("server").hits == 1
+
+    def test_compose_should_recompose_when_base_changes(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        base = mock_repo.create_file(".zshrc", "# base v1")
+        mock_repo.create_override("server", ".zshrc", "# appended", mode="append")
+        manager = OverrideManager(mock_repo.bundles_dir)
+        overrides = manager.find_overrides("server", ".zshrc")
+        manager.compose("server", base, overrides, ".zshrc")
+
+        # WHEN
+        base.write_text("# base v2")
+        result = manager.compose("server", base, overrides, ".zshrc")
+
+        # THEN
+        assert result == b"# base v2\n\n# appended"
+
+    def test_cache_should_evict_least_recently_used_entries(self, tmp_path):
+        # GIVEN
+        import os
+        cache = CompositionCache(tmp_path / "compose", max_entries=2)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.put(key, key.encode())
+            os.utime(cache.cache_dir / key, (1000 + i, 1000 + i))
+
+        # WHEN
+        cache.put("d", b"d")
+
+        # THEN
+        assert sorted(p.name for p, _, _ in cache.entries()) == ["c", "d"]
+        assert cache.get("a") is None
+        assert cache.clear() == 2
+
+    def test_cache_should_take_concurrent_puts_and_gets(self, tmp_path, monkeypatch):
+        # GIVEN - two workers storing the same composition at the same moment
+        cache = CompositionCache(tmp_path / "compose", max_entries=100)
+        both_written = threading.Barrier(2)
+        replaced = []
+        real_replace = os.replace
+
+        def replace_together(src, dst):
+            both_written.wait(timeout=5)
+            real_replace(src, dst)
+            replaced.append(Path(src).name)
+
+        monkeypatch.setattr(os, "replace", replace_together)
+
+        # WHEN
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda _: cache.put("k", b"composed"), range(2)))
+        monkeypatch.setattr(os, "replace", real_replace)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda key: cache.get(key), ["k", "missing"] * 200))
+
+        # THEN - each writer had its own temp file, and no count was lost
+        assert len(set(replaced)) == 2
+        assert [p.name for p in cache.cache_dir.iterdir()] == ["k"]
+        assert (cache.hits, cache.misses) == (200, 200)
+
+
+# ============================================================================
+# Integration Tests: HashCache
+# ============================================================================
+
+
+def _write_aged(path: Path, content: str, seconds: int = 60) -> Path:
+    """Write a file with an mtime old enough for the hash cache to store it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    past = path.stat().st_mtime - seconds
+    os.utime(path, (past, past))
+    return path
+
+
+class TestHashCache:
+    """Tests for the persistent stat-keyed hash cache."""
+
+    def test_hash_cache_should_reuse_hashes_across_instances(self, tmp_path: Path, monkeypatch):
+        # GIVEN
+        source = _write_aged(tmp_path / "src" / ".zshrc", "# zshrc")
+        cache_dir = tmp_path / "cache"
+        first = HashCache(cache_dir)
+        expected = first.hash_file(source)
+        first.save()
+
+        def fail_hash(path):
+            raise AssertionError(f"unexpected hash of {path}")
+
+        monkeypatch.setattr(dotfiles_bundle, "file_sha256", fail_hash)
+
+        # WHEN
+        second = HashCache(cache_dir)
+        digest = second.hash_file(source)
+
+        # THEN
+        assert digest == expected
+        assert (second.hits, second.misses) == (1, 0)
+
+    def test_hash_cache_should_rehash_modified_file(self, tmp_path: Path):
+        # GIVEN
+        source = _write_aged(tmp_path / ".zshrc", "# old")
+        cache = HashCache(tmp_path / "cache")
+        old_digest = cache.hash_file(source)
+
+        # WHEN
+        _write_aged(source, "# new content", seconds=30)
+        new_digest = cache.hash_file(source)
+
+        # THEN
+        assert new_digest != old_digest
+        assert new_digest == dotfiles_bundle.file_sha256(source)
+
+    def test_hash_cache_should_not_store_recently_modified_files(self, tmp_path: Path):
+        # GIVEN
+        source = tmp_path / ".zshrc"
+        source.write_text("# just written")
+        cache = HashCache(tmp_path / "cache")
+
+        # WHEN
+        cache.hash_file(source)
+        cache.hash_file(source)
+
+        # THEN
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_hash_cache_should_report_stale_entries_in_verify_mode(self, tmp_path: Path):
+        # GIVEN
+        source = _write_aged(tmp_path / ".zshrc", "# zshrc")
+        cache = HashCache(tmp_path / "cache", verify=True)
+        cache.hash_file(source)
+        for entry in cache._entries.values():
+            entry[0] = "0" * 64  # Simulate a corrupted entry
+
+        # WHEN
+        digest = cache.hash_file(source)
+
+        # THEN
+        assert digest == dotfiles_bundle.file_sha256(source)
+        assert cache.mismatches == [str(source)]
+
+    def test_hash_cache_should_not_store_copies(self, tmp_path: Path):
+        # GIVEN - a temporary copy (materialized or pulled), old enough to be cached
+        copy = _write_aged(tmp_path / "package" / ".zshrc", "# zshrc")
+        cache = HashCache(tmp_path / "cache")
+
+        # WHEN
+        digest = cache.hash_copy(copy)
+
+        # THEN
+        assert digest == dotfiles_bundle.file_sha256(copy)
+        assert (cache.hits, cache.misses) == (0, 0)
+        assert cache._load() == {}
+
+    def test_classify_changes_should_share_hash_cache_with_builder(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        source = mock_repo.create_file(".zshrc", "# zshrc")
+        past = source.stat().st_mtime - 60
+        os.utime(source, (past, past))
+        config = BundleConfig(name="test", files_include=[".zshrc"])
+        files = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        ).resolve_bundle(config)
+        builder = PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir)
+        package_dir = mock_repo.root / "package"
+        remote_dir = mock_repo.root / "remote"
+        remote_dir.mkdir()
+        (remote_dir / ".zshrc").write_text("# zshrc")
+        package = builder.virtual_package(files)
+        manifest = dotfiles_bundle.build_manifest(
+            "test", files, builder.override_manager, package_dir, builder.hash_cache, package.records
+        )
+
+        # WHEN
+        result = classify_changes(
+            package_dir, remote_dir, [".zshrc"], manifest, builder.hash_cache, package.records
+        )
+
+        # THEN - the source was hashed once, for the package; nothing local is hashed again
+        assert result == {".zshrc": "unchanged"}
+        assert builder.hash_cache.misses == 1
+        assert builder.hash_cache.hits == 0
+
+    def test_hash_files_should_return_results_in_input_order(self, tmp_path: Path):
+        # GIVEN - a mix of cached and uncached files hashed on several threads
+        paths = [_write_aged(tmp_path / f"f{i}", f"content {i}" * (i + 1)) for i in range(50)]
+        cache = HashCache(workers=4)
+        cache.hash_files(paths[::3])
+
+        # WHEN
+        digests = cache.hash_files(paths)
+
+        # THEN
+        assert digests == [dotfiles_bundle.file_sha256(p) for p in paths]
+        assert cache.hits == 17
+
+    def test_hash_files_parallel_should_match_serial_hashing(self, tmp_path: Path):
+        # GIVEN - more files than one batch, including duplicates
+        paths = []
+        for i in range(dotfiles_bundle.HASH_BATCH_PER_WORKER * 2 + 5):
+            path = tmp_path / f"f{i % 40}"
+            path.write_text(f"content {i % 40}")
+            paths.append(str(path))
+
+        # WHEN
+        parallel = dotfiles_bundle.hash_files_parallel(paths, workers=2)
+
+        # THEN
+        assert parallel == dotfiles_bundle.hash_files_parallel(paths, workers=1)
+
+
+# ============================================================================
+# Integration Tests: Virtual Package
+# ============================================================================
+
+
+class TestVirtualPackage:
+    """Tests for PackageBuilder.virtual_package(), VirtualPackage and the consumers of its records."""
+
+    @pytest.fixture
+    def package(self, mock_repo: MockDotfilesRepo):
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".vimrc", "set nu")
+        mock_repo.create_bundle("test", '[files]\ninclude = [".zshrc", ".vimrc"]')
+        mock_repo.create_override("test", ".zshrc", "# extra", mode="append")
+        mock_repo.create_addition("test", ".hgrc", "[ui]")
+        config = BundleConfig(name="test", files_include=[".zshrc", ".vimrc"])
+        files = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        ).resolve_bundle(config)
+        builder = PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir)
+        package = builder.virtual_package(files)
+        package_dir = package.materialize(package.records, mock_repo.root / "package")
+        return builder, files, package_dir, package
+
+    def test_records_should_have_hash_and_size_of_deployed_content(self, package):
+        # GIVEN
+        builder, files, package_dir, package = package
+
+        # THEN
+        assert sorted(package.records) == [".hgrc", ".vimrc", ".zshrc"]
+        for rel, record in package.records.items():
+            content = (package_dir / rel).read_bytes()
+            assert record.sha256 == dotfiles_bundle.file_sha256(package_dir / rel)
+            assert record.size == len(content)
+        assert [ov.mode for ov in package.records[".zshrc"].overrides] == ["append"]
+        assert package.records[".hgrc"].source_type == "addition"
+
+    def test_consumers_should_not_read_package_files(self, package, monkeypatch):
+        # GIVEN
+        builder, files, package_dir, package = package
+        staged = package.records
+        expected_manifest = dotfiles_bundle.build_manifest(
+            "test", files, builder.override_manager, package_dir, HashCache()
+        )
+        expected_provenance = dotfiles_bundle.build_provenance_map("test", files, builder.override_manager)
+        remote_dir = package_dir.parent / "remote"
+        shutil.copytree(package_dir, remote_dir)
+        (remote_dir / ".vimrc").write_text("set nonu")
+
+        real_sha256 = dotfiles_bundle.file_sha256
+
+        def guarded_sha256(path):
+            assert package_dir not in Path(path).parents, f"package file read back: {path}"
+            return real_sha256(path)
+
+        monkeypatch.setattr(dotfiles_bundle, "file_sha256", guarded_sha256)
+
+        # WHEN
+        manifest = dotfiles_bundle.build_manifest(
+            "test", files, builder.override_manager, package_dir, HashCache(), staged
+        )
+        provenance = dotfiles_bundle.build_provenance_map("test", files, builder.override_manager, staged)
+        result = classify_changes(
+            package_dir, remote_dir, sorted(staged), manifest, HashCache(), staged
+        )
+
+        # THEN
+        assert manifest["files"] == expected_manifest["files"]
+        assert provenance == expected_provenance
+        assert result == {".hgrc": "unchanged", ".vimrc": "remote_only", ".zshrc": "unchanged"}
+
+    def test_virtual_package_should_not_write(self, package, monkeypatch):
+        # GIVEN
+        builder, files, package_dir, expected = package
+
+        def no_writes(*args, **kwargs):
+            raise AssertionError("virtual package wrote a file")
+
+        monkeypatch.setattr(dotfiles_bundle, "link_or_copy", no_writes)
+        monkeypatch.setattr(Path, "write_bytes", no_writes)
+
+        # WHEN
+        package = builder.virtual_package(files)
+
+        # THEN - same records, content served from sources and compositions
+        assert list(package.records) == list(expected.records)
+        assert list(package.records.values()) == list(expected.records.values())
+        for rel in package.records:
+            assert package.content(rel) == (package_dir / rel).read_bytes()
+
+    def test_materialize_should_write_only_requested_paths(self, package, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        builder, files, package_dir, package = package
+        written = package.materialized
+
+        # WHEN
+        local_dir = package.materialize([".zshrc", ".hgrc", ".not-in-package"], mock_repo.root / "local")
+
+        # THEN
+        assert sorted(p.name for p in local_dir.iterdir()) == [".hgrc", ".zshrc"]
+        assert (local_dir / ".zshrc").read_bytes() == (package_dir / ".zshrc").read_bytes()
+        assert package.materialized - written == 2
+
+    def test_materialize_should_hardlink_unmodified_sources(self, package, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        builder, files, package_dir, package = package
+
+        # THEN - plain files share the source inode, composed files don't
+        assert (package_dir / ".vimrc").samefile(mock_repo.links_dir / ".vimrc")
+        assert not (package_dir / ".zshrc").samefile(mock_repo.links_dir / ".zshrc")
+        assert package.records[".vimrc"].sha256 == dotfiles_bundle.file_sha256(mock_repo.links_dir / ".vimrc")
+
+    def test_materialize_should_copy_when_hardlinks_fail(self, mock_repo: MockDotfilesRepo, monkeypatch):
+        # GIVEN - a package directory on another filesystem
+        source = mock_repo.create_file(".vimrc", "set nu")
+        files = [ResolvedFile(source, ".vimrc", "links")]
+        builder = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir)
+
+        def cross_device(src, dst, **kwargs):
+            raise OSError(18, "Invalid cross-device link")
+
+        monkeypatch.setattr(os, "link", cross_device)
+
+        # WHEN
+        package = builder.virtual_package(files)
+        package_dir = package.materialize([".vimrc"], mock_repo.root / "package")
+
+        # THEN
+        written = package_dir / ".vimrc"
+        assert written.read_text() == "set nu"
+        assert not written.samefile(source)
+        assert written.stat().st_mtime_ns == source.stat().st_mtime_ns
+        assert package.records[".vimrc"].size == len("set nu")
+
+    def test_materialize_should_not_write_through_hardlinks(self, mock_repo: MockDotfilesRepo):
+        # GIVEN - a file hardlinked by an earlier materialize, then an addition replacing it
+        source = mock_repo.create_file(".hgrc", "[ui] from links")
+        files = [ResolvedFile(source, ".hgrc", "links")]
+        builder = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir)
+        package_dir = builder.virtual_package(files).materialize([".hgrc"], mock_repo.root / "package")
+        mock_repo.create_addition("test", ".hgrc", "[ui] from bundle")
+
+        # WHEN
+        builder = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir)
+        builder.virtual_package(files).materialize([".hgrc"], package_dir)
+
+        # THEN
+        assert (package_dir / ".hgrc").read_text() == "[ui] from bundle"
+        assert source.read_text() == "[ui] from links"
+
+    def _nested_files(self, mock_repo: MockDotfilesRepo) -> list[ResolvedFile]:
+        """Many files sharing deep parent directories, a few with overrides."""
+        files = []
+        for i in range(40):
+            rel = f".config/app{i % 3}/sub{i % 2}/file{i}.toml"
+            files.append(ResolvedFile(mock_repo.create_file(rel, f"key = {i}\n"), rel, "links"))
+            if i % 10 == 0:
+                mock_repo.create_override("test", rel, f"extra = {i}\n", mode="append")
+        return files
+
+    def test_virtual_package_should_match_serial_composition_with_workers(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        files = self._nested_files(mock_repo)
+        serial = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir, workers=1)
+        pooled = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir, workers=8)
+
+        # WHEN
+        expected = serial.virtual_package(files)
+        package = pooled.virtual_package(files)
+
+        # THEN - same records in the same order, same content
+        assert list(package.records) == list(expected.records)
+        assert list(package.records.values()) == list(expected.records.values())
+        for rel in package.records:
+            assert package.content(rel) == expected.content(rel)
+
+    def test_virtual_package_should_report_every_failing_file(self, mock_repo: MockDotfilesRepo, capsys):
+        # GIVEN - two sources that vanish before the package is read
+        files = self._nested_files(mock_repo)
+        for resolved in (files[3], files[7]):
+            os.unlink(resolved.source)
+        builder = PackageBuilder("test", BundleConfig(name="test"), bundles_dir=mock_repo.bundles_dir, workers=4)
+
+        # WHEN
+        with pytest.raises(SystemExit):
+            builder.virtual_package(files)
+
+        # THEN - both are named
+        err = capsys.readouterr().err
+        assert "Failed to read 2 file(s)" in err
+        assert files[3].relative_path in err and files[7].relative_path in err
+
+
+# ============================================================================
+# Integration Tests: PackageBuilder
+# ============================================================================
+
+
+class TestPackageBuilder:
+    """Tests for package building."""
+
+    def test_package_builder_should_create_tarball(self, mock_repo: MockDotfilesRepo):
         # GIVEN
         mock_repo.create_file(".zshrc", "# zshrc content")
         mock_repo.create_file(".gitconfig", "# gitconfig content")
@@ -926,6 +1990,413 @@ class TestPackageBuilder:
             # Verify .add is NOT in the extracted paths
             assert not any(".add" in n for n in names if "my-tool" in n)
 
+    def test_package_builder_should_stream_same_layout_as_staged_package(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN - verbatim, composed, nested, addition and util/ members
+        mock_repo.create_file(".zshrc", "# zshrc")
+        mock_repo.create_file(".config/nvim/init.lua", "-- init")
+        mock_repo.create_file(".gitconfig", "[user]")
+        mock_repo.create_override("test", ".gitconfig", "# extra", mode="append")
+        mock_repo.create_addition("test", ".hgrc", "[ui]")
+        mock_repo.create_util()
+        config = BundleConfig(
+            name="test",
+            files_include=[".zshrc", ".config/nvim", ".gitconfig"],
+            packages_install=["git"],
+        )
+        files = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        ).resolve_bundle(config)
+        builder = PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir, util_dir=mock_repo.util_dir)
+
+        staged_dir = mock_repo.root / "staged" / "dotfiles-test"
+        package = builder.virtual_package(files)
+        package.materialize(package.records, staged_dir)
+        shutil.copytree(mock_repo.util_dir, staged_dir / "util")
+        builder._generate_install_script(staged_dir)
+        builder._generate_readme(staged_dir)
+        staged_tar = mock_repo.root / "staged.tar.gz"
+        with tarfile.open(staged_tar, "w:gz") as tar:
+            tar.add(staged_dir, arcname=staged_dir.name)
+
+        def no_staging(*args, **kwargs):
+            raise AssertionError("build() must not stage files on disk")
+
+        monkeypatch.setattr(shutil, "copy2", no_staging)
+        monkeypatch.setattr(shutil, "copytree", no_staging)
+        monkeypatch.setattr(tempfile, "TemporaryDirectory", no_staging)
+
+        # WHEN
+        output_path = mock_repo.root / "streamed.tar.gz"
+        builder.build(files, output_path)
+
+        # THEN
+        with tarfile.open(staged_tar, "r:gz") as expected, tarfile.open(output_path, "r:gz") as actual:
+            assert actual.getnames() == expected.getnames()
+            for want, got in zip(expected.getmembers(), actual.getmembers()):
+                assert (got.type, got.mode) == (want.type, want.mode), got.name
+                if got.isfile():
+                    assert actual.extractfile(got).read() == expected.extractfile(want).read()
+
+    def test_parallel_gzip_writer_should_write_ordered_gzip_members(self, monkeypatch):
+        # GIVEN - blocks small enough to give many members
+        monkeypatch.setattr(dotfiles_bundle, "GZIP_BLOCK_SIZE", 1000)
+        data = b"".join(f"line {i}\n".encode() for i in range(5000))
+        out = io.BytesIO()
+
+        # WHEN
+        with dotfiles_bundle.ParallelGzipWriter(out, jobs=3) as writer:
+            for start in range(0, len(data), 777):
+                writer.write(data[start : start + 777])
+
+        # THEN
+        compressed = out.getvalue()
+        assert gzip.decompress(compressed) == data
+        assert compressed.count(b"\x1f\x8b\x08") >= len(data) // 1000
+        assert writer.bytes_in == len(data)
+
+    @pytest.mark.skipif(shutil.which("tar") is None, reason="tar not installed")
+    def test_package_builder_should_build_tar_xzf_compatible_parallel_gzip(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        monkeypatch.setattr(dotfiles_bundle, "GZIP_BLOCK_SIZE", 4096)
+        for i in range(20):
+            mock_repo.create_file(f".config/tool/file{i}.conf", f"setting = {i}\n" * 200)
+        config = BundleConfig(name="test", files_include=[".config/tool"])
+        files = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        ).resolve_bundle(config)
+        builder = PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir)
+        output_path = mock_repo.root / "test.tar.gz"
+
+        # WHEN
+        builder.build(files, output_path, jobs=4)
+
+        # THEN
+        extract_dir = mock_repo.root / "extract"
+        extract_dir.mkdir()
+        subprocess.run(["tar", "-xzf", str(output_path), "-C", str(extract_dir)], check=True)
+        for i in range(20):
+            extracted = extract_dir / "dotfiles-test" / ".config" / "tool" / f"file{i}.conf"
+            assert extracted.read_text() == f"setting = {i}\n" * 200
+        stats = builder.compression_stats
+        assert stats.jobs == 4
+        assert stats.compressed == output_path.stat().st_size
+        assert stats.raw > stats.compressed
+
+    @pytest.mark.parametrize("codec", ["none", "gz", "bz2", "xz"])
+    def test_package_builder_should_build_with_codec(self, mock_repo: MockDotfilesRepo, codec: str):
+        # GIVEN
+        mock_repo.create_file(".zshrc", "# zshrc content")
+        mock_repo.create_util()
+        config = BundleConfig(name="test", files_include=[".zshrc"], packages_install=["git"])
+        files = [ResolvedFile(mock_repo.links_dir / ".zshrc", ".zshrc", "links")]
+        builder = PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir, util_dir=mock_repo.util_dir)
+        archive = dotfiles_bundle.ARCHIVE_CODECS[codec]
+        output_path = mock_repo.root / f"dotfiles-test{archive.extension}"
+
+        # WHEN
+        builder.build(files, output_path, codec=codec)
+
+        # THEN - readable with the codec, and the README tells how to extract it
+        with tarfile.open(output_path, f"r:{'' if codec == 'none' else codec}") as tar:
+            assert tar.extractfile("dotfiles-test/.zshrc").read() == b"# zshrc content"
+            readme = tar.extractfile("dotfiles-test/README.md").read().decode()
+        assert archive.extract_command(output_path.name) in readme
+        assert builder.compression_stats.level == archive.default_level
+
+    def _reproducible_builder(self, mock_repo: MockDotfilesRepo):
+        mock_repo.create_file(".zshrc", "# zshrc content")
+        mock_repo.create_file(".bin/tool", "#!/bin/sh")
+        (mock_repo.links_dir / ".bin" / "tool").chmod(0o775)
+        config = BundleConfig(name="test", files_include=[".zshrc", ".bin/"])
+        files = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+        ).resolve_bundle(config)
+        return PackageBuilder("test", config, bundles_dir=mock_repo.bundles_dir), files
+
+    def test_package_builder_should_build_reproducible_archives(self, mock_repo: MockDotfilesRepo):
+        # GIVEN - same contents, different mtimes between builds
+        builder, files = self._reproducible_builder(mock_repo)
+        first = builder.build(files, mock_repo.root / "first.tar.gz", use_cache=False)
+        os.utime(mock_repo.links_dir / ".zshrc", (1_000_000_000, 1_000_000_000))
+
+        # WHEN
+        second = builder.build(files, mock_repo.root / "second.tar.gz", use_cache=False)
+
+        # THEN
+        assert first.read_bytes() == second.read_bytes()
+        with tarfile.open(second) as tar:
+            members = {m.name: m for m in tar.getmembers()}
+        assert {(m.uid, m.gid, m.mtime) for m in members.values()} == {(0, 0, dotfiles_bundle.REPRODUCIBLE_MTIME)}
+        assert members["dotfiles-test/.bin/tool"].mode == 0o755
+        assert members["dotfiles-test/.zshrc"].mode == 0o644
+
+    def test_package_builder_should_serve_unchanged_inputs_from_build_cache(
+        self, mock_repo: MockDotfilesRepo, monkeypatch
+    ):
+        # GIVEN
+        builder, files = self._reproducible_builder(mock_repo)
+        first = builder.build(files, mock_repo.root / "first.tar.gz")
+        digest = builder.input_digest
+
+        def fail_write(*args):
+            raise AssertionError("archive rebuilt despite unchanged inputs")
+
+        monkeypatch.setattr(PackageBuilder, "_write_members", fail_write)
+
+        # WHEN
+        second = builder.build(files, mock_repo.root / "second.tar.gz")
+
+        # THEN
+        assert builder.compression_stats.cached
+        assert builder.input_digest == digest
+        assert second.read_bytes() == first.read_bytes()
+
+    def test_package_builder_should_change_input_digest_with_content_or_codec(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        builder, files = self._reproducible_builder(mock_repo)
+        builder.build(files, mock_repo.root / "out.tar.gz")
+        digest = builder.input_digest
+
+        # WHEN
+        builder.build(files, mock_repo.root / "out.tar.xz", codec="xz")
+        xz_digest = builder.input_digest
+        (mock_repo.links_dir / ".zshrc").write_text("# changed")
+        builder.build(files, mock_repo.root / "out.tar.gz", codec="gz")
+
+        # THEN
+        assert len({digest, xz_digest, builder.input_digest}) == 3
+        assert not builder.compression_stats.cached
+
+    def test_resolve_archive_settings_should_prefer_arguments_then_bundle(self):
+        # GIVEN
+        config = BundleConfig(name="nas", archive_codec="xz", archive_level=9)
+        resolve = dotfiles_bundle.resolve_archive_settings
+
+        # THEN
+        assert [(a.name, level) for a, level in [
+            resolve(config),
+            resolve(config, level=1),
+            resolve(config, codec="gz"),
+            resolve(config, codec="none"),
+            resolve(BundleConfig(name="base")),
+        ]] == [("xz", 9), ("xz", 1), ("gz", 9), ("none", None), ("gz", 9)]
+
+    def test_resolve_archive_settings_should_reject_invalid_level(self):
+        with pytest.raises(ValueError, match="Invalid level 0 for bz2"):
+            dotfiles_bundle.resolve_archive_settings(BundleConfig(name="nas"), codec="bz2", level=0)
+
+    def test_compare_codecs_should_report_every_codec(self):
+        # GIVEN
+        raw = b"export PATH=$HOME/.bin:$PATH\n" * 1000
+
+        # WHEN
+        rows = dotfiles_bundle.compare_codecs(raw)
+
+        # THEN
+        names = {codec.name for codec, *_ in rows}
+        assert names == {"none", "gz", "bz2", "xz"}
+        for codec, level, size, compress_time, decompress_time in rows:
+            assert size == len(raw) if codec.name == "none" else size < len(raw)
+
+    def _delta_base(self, mock_repo: MockDotfilesRepo):
+        """Deploy the reproducible bundle to a local home, then change it."""
+        builder, files = self._reproducible_builder(mock_repo)
+        empty = {"bundle": "test", "deployed_at": "base", "files": {}}
+        base = builder.build_delta(files, empty, mock_repo.root / "full.tar.gz")["manifest"]
+        base["files"][".removed"] = {"hash": dotfiles_bundle.file_sha256(mock_repo.links_dir / ".zshrc")}
+        target = mock_repo.root / "target"
+        with tarfile.open(mock_repo.root / "full.tar.gz") as tar:
+            tar.extractall(mock_repo.root / "full")
+        shutil.copytree(mock_repo.root / "full" / "dotfiles-test-delta" / "files", target)
+        shutil.copy2(target / ".zshrc", target / ".removed")
+        (mock_repo.links_dir / ".zshrc").write_text("# zshrc changed")
+        return builder, files, base, target
+
+    def test_build_delta_should_hold_changed_files_and_deletions(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        builder, files, base, _ = self._delta_base(mock_repo)
+
+        # WHEN
+        delta = builder.build_delta(files, base, mock_repo.root / "delta.tar.gz")
+
+        # THEN
+        assert delta["changed"] == [".zshrc"]
+        assert delta["deleted"] == [".removed"]
+        with tarfile.open(mock_repo.root / "delta.tar.gz") as tar:
+            names = {m.name for m in tar.getmembers() if m.isfile()}
+            deleted = tar.extractfile("dotfiles-test-delta/deleted.list").read()
+            manifest = json.loads(tar.extractfile("dotfiles-test-delta/manifest.json").read())
+        assert names == {
+            f"dotfiles-test-delta/{name}"
+            for name in ("files/.zshrc", "deleted.list", "base.sha256", "manifest.json", "apply-delta.sh")
+        }
+        assert deleted == b".removed\0"
+        assert manifest["files"] == delta["manifest"]["files"]
+        assert set(manifest["files"]) == {".zshrc", ".bin/tool"}
+
+    @pytest.mark.skipif(
+        not (shutil.which("bash") and (shutil.which("sha256sum") or shutil.which("shasum"))),
+        reason="needs bash and sha256sum",
+    )
+    def test_apply_delta_should_verify_base_before_applying(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        builder, files, base, target = self._delta_base(mock_repo)
+        builder.build_delta(files, base, mock_repo.root / "delta.tar.gz")
+        with tarfile.open(mock_repo.root / "delta.tar.gz") as tar:
+            tar.extractall(mock_repo.root / "delta")
+        script = mock_repo.root / "delta" / "dotfiles-test-delta" / "apply-delta.sh"
+        (target / ".bin" / "tool").write_text("# edited on host")
+
+        # WHEN - the target drifted from the base
+        refused = subprocess.run(["bash", str(script), str(target)], capture_output=True, text=True)
+
+        # THEN
+        assert refused.returncode != 0
+        assert (target / ".zshrc").read_text() == "# zshrc content"
+        assert (target / ".removed").exists()
+
+        # WHEN - the target matches the base
+        (target / ".bin" / "tool").write_text("#!/bin/sh")
+        applied = subprocess.run(["bash", str(script), str(target)], capture_output=True, text=True)
+
+        # THEN
+        assert applied.returncode == 0, applied.stderr
+        assert (target / ".zshrc").read_text() == "# zshrc changed"
+        assert not (target / ".removed").exists()
+
+    def test_find_base_manifest_should_resolve_names_in_history(self, mock_repo: MockDotfilesRepo, monkeypatch):
+        # GIVEN
+        monkeypatch.setattr(dotfiles_bundle, "BUNDLES_DIR", mock_repo.bundles_dir)
+        history = mock_repo.bundles_dir / "test" / ".manifests" / "deploy"
+        history.mkdir(parents=True)
+        stored = history / "2026-01-01T000000+0000.json"
+        stored.write_text("{}")
+        find = dotfiles_bundle.find_base_manifest
+
+        # THEN
+        assert find("test", "2026-01-01T000000+0000") == stored
+        assert find("test", "2026-01-01T000000+0000.json") == stored
+        assert find("test", str(stored)) == stored
+        assert find("test", "missing") is None
+
+
+# ============================================================================
+# Multi-bundle Build Tests
+# ============================================================================
+
+
+class TestBuildBundles:
+    """Tests for build_bundles (build --all)."""
+
+    def _resolvers(self, mock_repo: MockDotfilesRepo):
+        mock_repo.create_file(".zshrc", "# zshrc content")
+        mock_repo.create_file(".vimrc", "set nocompatible")
+        mock_repo.create_bundle("base", '[files]\ninclude = [".zshrc"]\n')
+        mock_repo.create_bundle("server", '[bundle]\nextends = "base"\n[files]\ninclude = [".vimrc"]\n')
+        mock_repo.create_bundle("nas", '[bundle]\nextends = "base"\n[archive]\ncodec = "xz"\n')
+        file_resolver = FileResolver(
+            links_dir=mock_repo.links_dir,
+            links_in_depth_dir=mock_repo.links_in_depth_dir,
+            home_dir=mock_repo.home_dir,
+            use_cache=False,
+            listings={},
+        )
+        return BundleResolver(mock_repo.bundles_dir), file_resolver
+
+    def test_build_bundles_should_match_separate_builds(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        resolver, file_resolver = self._resolvers(mock_repo)
+        names = resolver.bundle_names()
+
+        # WHEN
+        results = dotfiles_bundle.build_bundles(
+            names, mock_repo.root / "out", parallel=3, resolver=resolver, file_resolver=file_resolver
+        )
+
+        # THEN
+        assert [r.name for r in results] == ["base", "nas", "server"]
+        assert [r.output.name for r in results] == ["dotfiles-base.tar.gz", "dotfiles-nas.tar.xz", "dotfiles-server.tar.gz"]
+        assert not any(r.error for r in results)
+        assert file_resolver.shared_listings > 0
+        for result in results:
+            config = resolver.resolve(result.name)
+            separate = PackageBuilder(result.name, config, bundles_dir=mock_repo.bundles_dir).build(
+                FileResolver(
+                    links_dir=mock_repo.links_dir,
+                    links_in_depth_dir=mock_repo.links_in_depth_dir,
+                    home_dir=mock_repo.home_dir,
+                    use_cache=False,
+                ).resolve_bundle(config),
+                mock_repo.root / f"separate{result.output.suffix}",
+                use_cache=False,
+            )
+            assert separate.read_bytes() == result.output.read_bytes()
+
+    def test_build_bundles_should_report_failures_per_bundle(self, mock_repo: MockDotfilesRepo, monkeypatch):
+        # GIVEN
+        resolver, file_resolver = self._resolvers(mock_repo)
+        build = PackageBuilder.build
+
+        def failing_build(self, files, output_path, **kwargs):
+            if self.bundle_name == "nas":
+                raise OSError("disk full")
+            return build(self, files, output_path, **kwargs)
+
+        monkeypatch.setattr(PackageBuilder, "build", failing_build)
+
+        # WHEN
+        results = dotfiles_bundle.build_bundles(
+            ["base", "nas", "server"], mock_repo.root / "out", resolver=resolver, file_resolver=file_resolver
+        )
+
+        # THEN
+        assert [r.error for r in results] == ["", "disk full", ""]
+        assert results[2].output.exists()
+
+    def test_build_bundles_should_report_unresolvable_bundles_and_build_the_rest(self, mock_repo: MockDotfilesRepo):
+        # GIVEN - a missing bundle, a circular extends and a bad [archive] codec
+        resolver, file_resolver = self._resolvers(mock_repo)
+        mock_repo.create_bundle("loop", '[bundle]\nextends = "loop"\n')
+        mock_repo.create_bundle("odd", '[bundle]\nextends = "base"\n[archive]\ncodec = "zip"\n')
+
+        # WHEN
+        results = dotfiles_bundle.build_bundles(
+            ["base", "missing", "loop", "odd", "server"], mock_repo.root / "out",
+            resolver=resolver, file_resolver=file_resolver,
+        )
+
+        # THEN
+        errors = [r.error for r in results]
+        assert errors[0] == errors[4] == ""
+        assert errors[1].startswith("Bundle not found: missing")
+        assert errors[2] == "Circular inheritance detected: loop"
+        assert errors[3].startswith("Unknown archive codec: zip")
+        assert [r.name for r in results if r.output and r.output.exists()] == ["base", "server"]
+
+    def test_hash_cache_should_share_digests_between_bundles(self, mock_repo: MockDotfilesRepo):
+        # GIVEN
+        path = _write_aged(mock_repo.root / "shared.txt", "shared")
+        shared: dict[str, str] = {}
+        HashCache(mock_repo.root / "a", shared=shared).hash_file(path)
+
+        # WHEN
+        other = HashCache(mock_repo.root / "b", shared=shared)
+        digest = other.hash_file(path)
+
+        # THEN
+        assert digest == dotfiles_bundle.file_sha256(path)
+        assert (other.hits, other.misses) == (1, 0)
+
 
 # ============================================================================
 # End-to-End Tests
@@ -1358,6 +2829,485 @@ class TestClassifyChanges:
         assert "deployed.txt" in changed_files
 
 
+# ============================================================================
+# Deploy Planning Tests
+# ============================================================================
+
+
+class TestPlanDeploy:
+    """Tests for plan_deploy() and Deployer.transfer()."""
+
+    def _staged(self, count: int) -> dict:
+        return {
+            f"f{i:05}": dotfiles_bundle.StagedFile(f"f{i:05}", f"/src/f{i:05}", "links", f"hash{i}", 1)
+            for i in range(count)
+        }
+
+    def test_plan_deploy_should_send_only_classified_changes(self):
+        # GIVEN - a large package with one local change and one preserved remote change
+        staged = self._staged(5000)
+        classifications = {fp: "unchanged" for fp in staged}
+        classifications["f00042"] = "local_only"
+        classifications["f00007"] = "remote_only"
+
+        # WHEN
+        changed, unchanged = dotfiles_bundle.plan_deploy(staged, classifications, excluded=["f00007"])
+
+        # THEN
+        assert changed == ["f00042"]
+        assert len(unchanged) == 4998
+
+    def test_plan_deploy_should_send_everything_without_remote_check(self):
+        # GIVEN - no classifications (--force, or the check failed): the remote may have drifted
+        staged = self._staged(3)
+
+        # WHEN
+        changed, unchanged = dotfiles_bundle.plan_deploy(staged, None, excluded=["f00001"])
+
+        # THEN
+        assert changed == ["f00000", "f00002"]
+        assert unchanged == []
+
+    def test_transfer_should_send_listed_files_without_checksum_pass(self, tmp_path: Path, monkeypatch):
+        # GIVEN
+        deployer = dotfiles_bundle.Deployer(dotfiles_bundle.Destination(name="host", target="user@host:~"))
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            files_from = next(arg for arg in cmd if arg.startswith("--files-from="))
+            calls.append((cmd, Path(files_from.split("=", 1)[1]).read_text()))
+            return subprocess.CompletedProcess(cmd, 0, stdout=">f+++++++++ .zshrc\n", stderr="")
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+
+        # WHEN
+        success, synced = deployer.transfer(tmp_path, [".zshrc", ".config/app/conf.toml"])
+
+        # THEN
+        cmd, listed = calls[0]
+        assert success and synced == [".zshrc"]
+        assert listed == ".zshrc\0.config/app/conf.toml\0"
+        assert not any(arg.startswith("-") and not arg.startswith("--") and "c" in arg for arg in cmd)
+        assert "--ignore-times" in cmd
+        assert cmd[-2:] == [f"{tmp_path}/", "user@host:~"]
+
+    def test_transfer_should_checksum_when_remote_was_not_checked(self, tmp_path: Path, monkeypatch):
+        # GIVEN
+        deployer = dotfiles_bundle.Deployer(dotfiles_bundle.Destination(name="host", target="user@host:~"))
+        calls = []
+        monkeypatch.setattr(
+            subprocess, "run",
+            lambda cmd, **kwargs: calls.append(cmd) or subprocess.CompletedProcess(cmd, 0, stdout="", stderr=""),
+        )
+
+        # WHEN
+        success, synced = deployer.transfer(tmp_path, [".zshrc"], checksum=True)
+
+        # THEN
+        assert success and synced == []
+        assert "-c" in calls[0]
+        assert "--ignore-times" not in calls[0]
+
+
+# ============================================================================
+# Remote Probe Tests
+# ============================================================================
+
+
+class TestRemoteProbe:
+    """Tests for Deployer.probe(), against a local directory standing in for the remote."""
+
+    def _remote_home(self, tmp_path: Path) -> Path:
+        home = tmp_path / "remote-home"
+        for rel, content in {
+            ".zshrc": "export EDITOR=nvim\n",
+            ".config/nvim/init.lua": "vim.o.number = true\n",
+            ".config/nvim/lua/plugins.lua": "return {}\n",
+            ".config/nvim/cache/state.json": "{}\n",
+            ".config/other/settings": "x\n",
+            "notes.txt": "not included\n",
+        }.items():
+            path = home / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        (home / ".zshrc").chmod(0o600)
+        return home
+
+    def _deployer(self, target: str):
+        return dotfiles_bundle.Deployer(dotfiles_bundle.Destination(name="host", target=target))
+
+    def test_probe_should_return_hashes_and_new_files_in_one_run(self, tmp_path: Path):
+        # GIVEN
+        home = self._remote_home(tmp_path)
+        deployer = self._deployer(str(home))
+
+        # WHEN
+        state = deployer.probe(
+            [".zshrc", ".config/nvim/init.lua", ".gone"],
+            include_patterns=[".zshrc", ".config/nvim/"],
+            exclude_patterns=[".config/nvim/cache/"],
+        )
+
+        # THEN
+        zshrc = state.files[".zshrc"]
+        assert zshrc.sha256 == hashlib.sha256(b"export EDITOR=nvim\n").hexdigest()
+        assert (zshrc.size, zshrc.mode) == (19, 0o600)
+        assert zshrc.mtime_ns == (home / ".zshrc").stat().st_mtime_ns
+        assert ".gone" not in state.files
+        assert state.new == [".config/nvim/lua/plugins.lua"]
+        assert not state.fetched
+
+    def test_probe_should_send_regexes_older_pythons_compile(self, tmp_path: Path, monkeypatch):
+        # GIVEN - patterns Python 3.11's fnmatch.translate turns into atomic groups
+        deployer = self._deployer("user@host:~")
+        requests = []
+
+        def fake_run(cmd, input=None, **kwargs):
+            requests.append(json.loads(input))
+            return subprocess.CompletedProcess(cmd, 0, stdout='{"files": {}, "new": []}', stderr="")
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+
+        # WHEN
+        deployer.probe([".zshrc"], ["*zsh*rc*", ".config/"], ["*cache*/*", "**/.git/"])
+
+        # THEN
+        request = requests[0]
+        for key in ("include", "exclude", "prune"):
+            assert request[key] and "(?>" not in request[key]
+
+    def test_probe_should_agree_with_rsync_fallback_state(self, tmp_path: Path):
+        # GIVEN - a fallback copy holds exactly what the include patterns select
+        home = self._remote_home(tmp_path)
+        copy = tmp_path / "copy"
+        for rel in [".zshrc", ".config/nvim/init.lua", ".config/nvim/lua/plugins.lua"]:
+            (copy / rel).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(home / rel, copy / rel)
+        paths = [".zshrc", ".config/nvim/init.lua"]
+
+        # WHEN
+        probed = self._deployer(str(home)).probe(paths, [".zshrc", ".config/nvim/"], [".config/nvim/cache/"])
+        fetched = dotfiles_bundle.RemoteState.from_dir(copy, paths, HashCache(None))
+
+        # THEN
+        assert probed.hashes == fetched.hashes
+        assert probed.new == fetched.new
+        assert fetched.fetched
+
+    def test_classify_changes_should_accept_probed_remote_hashes(self, tmp_path: Path):
+        # GIVEN
+        home = self._remote_home(tmp_path)
+        local_dir = tmp_path / "local"
+        (local_dir / ".config/nvim").mkdir(parents=True)
+        (local_dir / ".zshrc").write_text("export EDITOR=vim\n")
+        (local_dir / ".config/nvim/init.lua").write_text("vim.o.number = true\n")
+        (local_dir / ".new").write_text("local only\n")
+        paths = [".zshrc", ".config/nvim/init.lua", ".new"]
+        manifest = {"files": {".zshrc": {"hash": hashlib.sha256(b"export EDITOR=vim\n").hexdigest()}}}
+        state = self._deployer(str(home)).probe(paths)
+
+        # WHEN
+        probed = classify_changes(local_dir, None, paths, manifest, remote_hashes=state.hashes)
+        copied = classify_changes(local_dir, home, paths, manifest)
+
+        # THEN
+        assert probed == copied == {".zshrc": "remote_only", ".config/nvim/init.lua": "unchanged", ".new": "local_only"}
+
+    def test_probe_walk_roots_should_list_literal_directory_prefixes(self):
+        # WHEN
+        roots = dotfiles_bundle.probe_walk_roots([
+            ".zshrc", ".config/nvim/", ".config/nvim/lua/", ".local/bin/*", ".ssh/**/config", "*.conf",
+        ])
+
+        # THEN
+        assert roots == [["", False], [".config/nvim", True], [".local/bin", False], [".ssh", True]]
+
+    def test_probe_should_run_over_ssh_and_return_none_when_it_cannot(self, monkeypatch):
+        # GIVEN - no python3 on the destination
+        deployer = self._deployer("user@host:~")
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            calls.append((cmd, json.loads(kwargs["input"])))
+            return subprocess.CompletedProcess(cmd, 127, stdout="", stderr="python3: not found")
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+
+        # WHEN
+        state = deployer.probe([".zshrc"], [".config/"])
+
+        # THEN
+        cmd, request = calls[0]
+        assert state is None
+        assert cmd[0] == "ssh" and cmd[-2] == "user@host"
+        assert cmd[-1].startswith('python3 -c "import base64;')
+        assert request["root"] == "~"
+        assert request["paths"] == [".zshrc"]
+        assert request["walk"] == [[".config", True]]
+
+
+# ============================================================================
+# SSH Connection Pool Tests
+# ============================================================================
+
+
+class TestSSHConnectionPool:
+    """Tests for SSHConnectionPool and Deployer multiplexing, with ssh faked."""
+
+    @pytest.fixture
+    def fake_ssh(self, monkeypatch):
+        """Record ssh calls; a master 'runs' while its socket file exists."""
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            calls.append(cmd)
+            control_path = Path(next(a for a in cmd if a.startswith("ControlPath=")).split("=", 1)[1])
+            if "-fNM" in cmd:
+                control_path.touch()
+                return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+            if cmd[1:3] == ["-O", "check"]:
+                return subprocess.CompletedProcess(cmd, 0 if control_path.exists() else 255, stdout="", stderr="")
+            if cmd[1:3] == ["-O", "exit"]:
+                existed = control_path.exists()
+                control_path.unlink(missing_ok=True)
+                return subprocess.CompletedProcess(cmd, 0 if existed else 255, stdout="", stderr="")
+            raise AssertionError(f"unexpected command: {cmd}")
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+        return calls
+
+    def _deployer(self, tmp_path: Path, target: str = "user@host:~", ssh_opts: str = "-p 2222", persist=None):
+        pool = dotfiles_bundle.SSHConnectionPool(tmp_path / "ssh", persist=persist)
+        destination = dotfiles_bundle.Destination(name="host", target=target, ssh_opts=ssh_opts)
+        return dotfiles_bundle.Deployer(destination, pool=pool)
+
+    def test_second_invocation_should_reuse_master_without_handshake(self, tmp_path: Path, fake_ssh):
+        # GIVEN - a first command leaves its master running
+        first = self._deployer(tmp_path)
+        assert first.start_multiplexing()
+        first.stop_multiplexing()
+        started = [cmd for cmd in fake_ssh if "-fNM" in cmd]
+
+        # WHEN - a later command (new pool, new deployer) connects to the same host
+        second = self._deployer(tmp_path)
+        fake_ssh.clear()
+        connected = second.start_multiplexing()
+
+        # THEN
+        assert connected and second.reused_connection and not first.reused_connection
+        assert len(started) == 1 and "ControlPersist=10m" in started[0]
+        assert [cmd[1:3] for cmd in fake_ssh] == [["-O", "check"]]
+        assert second._ssh_opts() == ["-p", "2222", "-o", f"ControlPath={started[0][3].split('=', 1)[1]}"]
+
+    def test_pool_should_key_masters_by_host_and_ssh_options(self, tmp_path: Path):
+        # GIVEN
+        pool = dotfiles_bundle.SSHConnectionPool(tmp_path / "ssh")
+
+        # WHEN
+        path = pool.control_path("user@host", ["-p", "2222"])
+
+        # THEN
+        assert path == dotfiles_bundle.SSHConnectionPool(tmp_path / "ssh").control_path("user@host", ["-p", "2222"])
+        assert path != pool.control_path("user@host", [])
+        assert path != pool.control_path("user@other", ["-p", "2222"])
+
+    def test_connections_should_list_live_masters_and_drop_stale_ones(self, tmp_path: Path, fake_ssh):
+        # GIVEN - two masters, one of which has since exited on its own
+        self._deployer(tmp_path, target="a@alpha:~").start_multiplexing()
+        self._deployer(tmp_path, target="b@beta:~", ssh_opts="").start_multiplexing()
+        pool = dotfiles_bundle.SSHConnectionPool(tmp_path / "ssh")
+        pool.control_path("b@beta", []).unlink()
+
+        # WHEN
+        connections = pool.connections()
+
+        # THEN
+        assert [(c.host, c.ssh_opts, c.persist) for c in connections] == [("a@alpha", ["-p", "2222"], "10m")]
+        assert sorted(p.name for p in (tmp_path / "ssh").iterdir()) == sorted(
+            [connections[0].control_path.name, connections[0].control_path.name + ".json"]
+        )
+        assert pool.close(connections[0])
+        assert pool.connections() == []
+
+    def test_disabled_pool_should_close_private_master_on_stop(self, tmp_path: Path, fake_ssh):
+        # GIVEN
+        deployer = self._deployer(tmp_path, persist="0")
+
+        # WHEN
+        deployer.start_multiplexing()
+        deployer.stop_multiplexing()
+
+        # THEN
+        assert f"ControlPath=/tmp/dotfiles-bundle-ssh-{os.getpid()}" in fake_ssh[0]
+        assert fake_ssh[-1][1:3] == ["-O", "exit"]
+        assert not (tmp_path / "ssh").exists()
+
+    @pytest.mark.parametrize("layout", ["group-writable", "symlink"])
+    def test_pool_should_refuse_control_dir_others_can_reach(self, tmp_path: Path, fake_ssh, layout: str):
+        # GIVEN - a control dir another user could plant sockets in
+        if layout == "group-writable":
+            (tmp_path / "ssh").mkdir(mode=0o700)
+            (tmp_path / "ssh").chmod(0o770)
+        else:
+            (tmp_path / "elsewhere").mkdir(mode=0o700)
+            (tmp_path / "ssh").symlink_to(tmp_path / "elsewhere")
+        deployer = self._deployer(tmp_path)
+
+        # WHEN
+        connected = deployer.start_multiplexing()
+        deployer.stop_multiplexing()
+
+        # THEN - a private per-process master instead, closed on stop
+        assert connected and not deployer.reused_connection
+        assert not any(str(tmp_path) in arg for cmd in fake_ssh for arg in cmd)
+        assert fake_ssh[-1][1:3] == ["-O", "exit"]
+        assert not deployer.pool.is_private(create=True)
+        assert deployer.pool.connections() == []
+
+
+# ============================================================================
+# Fan-out Deploy Tests
+# ============================================================================
+
+
+class TestFanOutDeploy:
+    """Tests for destination inventories, check_hosts() and deploy_hosts()."""
+
+    INVENTORY = """
+ssh_opts = "-J bastion"
+control_persist = "30m"
+
+[hosts.web1]
+target = "deploy@web1:~"
+groups = ["web", "canary"]
+
+[hosts.web2]
+target = "deploy@web2:~"
+groups = ["web"]
+
+[hosts.db1]
+target = "deploy@db1:~"
+ssh_opts = "-p 2222"
+"""
+
+    @pytest.fixture
+    def bundles_dir(self, tmp_path: Path, monkeypatch) -> Path:
+        bundles_dir = tmp_path / "bundles"
+        (bundles_dir / "fleet").mkdir(parents=True)
+        monkeypatch.setattr(dotfiles_bundle, "BUNDLES_DIR", bundles_dir)
+        return bundles_dir
+
+    def _package(self, tmp_path: Path):
+        """A two-file package: .zshrc changed locally to "new", .vimrc unchanged."""
+        source_dir = tmp_path / "src"
+        source_dir.mkdir()
+        records, digests = {}, {}
+        for rel, content in {".zshrc": "new\n", ".vimrc": "same\n"}.items():
+            (source_dir / rel).write_text(content)
+            digests[rel] = hashlib.sha256(content.encode()).hexdigest()
+            records[rel] = dotfiles_bundle.StagedFile(rel, source_dir / rel, "links", digests[rel], len(content))
+        return dotfiles_bundle.VirtualPackage(records, {}), digests
+
+    def _host_dir(self, tmp_path: Path, name: str, files: dict) -> Path:
+        host_dir = tmp_path / name
+        host_dir.mkdir()
+        for rel, content in files.items():
+            (host_dir / rel).write_text(content)
+        return host_dir
+
+    def test_load_destinations_should_read_inventory_with_defaults_and_groups(self, bundles_dir: Path):
+        # GIVEN
+        (bundles_dir / "fleet" / "destination.private").write_text(self.INVENTORY)
+
+        # WHEN
+        destinations = dotfiles_bundle.load_destinations("fleet")
+        web = dotfiles_bundle.select_destinations(destinations, ["web"])
+        picked = dotfiles_bundle.select_destinations(destinations, ["canary", "db1"])
+
+        # THEN
+        assert [(d.host, d.target, d.ssh_opts, d.control_persist) for d in destinations] == [
+            ("web1", "deploy@web1:~", "-J bastion", "30m"),
+            ("web2", "deploy@web2:~", "-J bastion", "30m"),
+            ("db1", "deploy@db1:~", "-p 2222", "30m"),
+        ]
+        assert [d.host for d in web] == ["web1", "web2"]
+        assert [d.host for d in picked] == ["web1", "db1"]
+        with pytest.raises(SystemExit):
+            dotfiles_bundle.select_destinations(destinations, ["nope"])
+
+    def test_single_host_commands_should_need_host_for_an_inventory(self, bundles_dir: Path):
+        # GIVEN
+        (bundles_dir / "fleet" / "destination.private").write_text(self.INVENTORY)
+
+        # WHEN/THEN
+        assert dotfiles_bundle.load_destination_for_bundle("fleet", host="db1").target == "deploy@db1:~"
+        with pytest.raises(SystemExit):
+            dotfiles_bundle.load_destination_for_bundle("fleet")
+
+    def test_check_hosts_should_plan_each_host_against_its_own_manifest(self, tmp_path: Path, bundles_dir: Path):
+        # GIVEN - web1 still has the last deploy; web2 was edited remotely after the same deploy
+        package, digests = self._package(tmp_path)
+        old = hashlib.sha256(b"old\n").hexdigest()
+        hosts = []
+        for name, remote_zshrc in (("web1", "old\n"), ("web2", "edited on web2\n")):
+            host_dir = self._host_dir(tmp_path, name, {".zshrc": remote_zshrc, ".vimrc": "same\n"})
+            dotfiles_bundle.write_manifest(
+                "fleet", {"deployed_at": "2026-01-01T00:00:00", "files": {
+                    ".zshrc": {"hash": old}, ".vimrc": {"hash": digests[".vimrc"]},
+                }}, host=name,
+            )
+            destination = dotfiles_bundle.Destination(name=name, target=str(host_dir), host=name)
+            hosts.append(dotfiles_bundle.HostDeploy(destination))
+
+        # WHEN
+        dotfiles_bundle.check_hosts(hosts, "fleet", package.records, [".vimrc", ".zshrc"], PatternSet([]), parallel=2)
+
+        # THEN
+        web1, web2 = hosts
+        assert (web1.status, web1.changed, web1.unchanged) == ("planned", [".zshrc"], 1)
+        assert (web2.status, web2.changed, web2.conflicts) == ("up to date", [], [".zshrc"])
+        assert web1.checked and "check" in web1.seconds
+        assert not (bundles_dir / "fleet" / dotfiles_bundle.MANIFEST_FILENAME).exists()
+
+    def test_deploy_hosts_should_send_per_host_changes_and_isolate_failures(
+        self, tmp_path: Path, bundles_dir: Path, monkeypatch
+    ):
+        # GIVEN - web2's backup fails
+        package, _ = self._package(tmp_path)
+        sent = {}
+
+        def fake_transfer(deployer, package_dir, rel_paths, checksum=False):
+            sent[deployer.destination.host] = sorted(p.name for p in package_dir.iterdir()), checksum
+            return True, list(rel_paths)
+
+        monkeypatch.setattr(dotfiles_bundle.Deployer, "transfer", fake_transfer)
+        monkeypatch.setattr(
+            dotfiles_bundle, "backup_remote_files",
+            lambda deployer, files: None if deployer.destination.host == "web2" else "20260101T000000",
+        )
+        hosts = []
+        for name, changed in (("web1", [".zshrc"]), ("web2", [".zshrc", ".vimrc"]), ("web3", [])):
+            destination = dotfiles_bundle.Destination(name=name, target=f"deploy@{name}:~", host=name)
+            host = dotfiles_bundle.HostDeploy(destination, changed=changed, status="planned" if changed else "up to date")
+            host.deployer = dotfiles_bundle.Deployer(destination)
+            hosts.append(host)
+
+        # WHEN
+        dotfiles_bundle.deploy_hosts(
+            hosts, "fleet", package, tmp_path / "hosts", {"bundle": "fleet", "files": {}}, parallel=3
+        )
+
+        # THEN
+        web1, web2, web3 = hosts
+        assert (web1.status, web1.synced, web1.backup) == ("deployed", 1, "20260101T000000")
+        assert web2.status == "failed" and "backup failed" in web2.error
+        assert web3.status == "up to date"
+        assert sent == {"web1": ([".zshrc"], True)}  # Not checked: rsync -c
+        assert dotfiles_bundle.read_manifest("fleet", "web1")["host"] == "web1"
+        assert dotfiles_bundle.read_manifest("fleet", "web3")["host"] == "web3"
+        assert dotfiles_bundle.read_manifest("fleet", "web2") is None
+
+
 # ============================================================================
 # Pull Helper Tests
 # ============================================================================